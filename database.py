@@ -5,16 +5,32 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import (
+    AutoReconnect,
+    BulkWriteError,
+    NotPrimaryError,
+    OperationFailure,
+    ServerSelectionTimeoutError,
+)
 from datetime import datetime, timezone
+import asyncio
+import logging
 import os
 from dotenv import load_dotenv
-from typing import Union
+from typing import List, Optional, Union
 from pydantic import BaseModel
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+TRANSIENT_ERRORS = (AutoReconnect, NotPrimaryError, ServerSelectionTimeoutError)
+
 _client = None
 db = None
 
@@ -22,11 +38,11 @@ database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(database_url)
     db = _client[database_name]
 
 # Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
     """Insert a single document with timestamp"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -40,10 +56,116 @@ def create_document(collection_name: str, data: Union[BaseModel, dict]):
     data_dict['created_at'] = datetime.now(timezone.utc)
     data_dict['updated_at'] = datetime.now(timezone.utc)
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(data_dict)
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+_STOP = object()
+
+class BatchWriter:
+    """Buffer inserts for one collection and flush them with a single insert_many.
+
+    Ids are assigned client-side, so callers get the new document id back
+    immediately; the document is written on the next flush (at most
+    `interval` seconds later). The queue is bounded, so a slow database makes
+    `insert` wait instead of growing memory without limit.
+    """
+
+    def __init__(self, collection_name: str, max_batch: int = 50, interval: float = 0.02, max_queued: int = 1000,
+                 retries: int = 3, retry_backoff: float = 0.1):
+        self.collection_name = collection_name
+        self.max_batch = max_batch
+        self.interval = interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+        self._task: Optional[asyncio.Task] = None
+
+    async def insert(self, data: Union[BaseModel, dict]) -> str:
+        """Queue a single document with timestamp and return its id"""
+        if db is None:
+            raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+        if isinstance(data, BaseModel):
+            data_dict = data.model_dump()
+        else:
+            data_dict = data.copy()
+
+        data_dict['_id'] = ObjectId()
+        data_dict['created_at'] = datetime.now(timezone.utc)
+        data_dict['updated_at'] = datetime.now(timezone.utc)
+
+        await self._queue.put(data_dict)
+        return str(data_dict['_id'])
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background flusher and write whatever is still queued"""
+        if self._task is not None:
+            # A sentinel rather than cancel(), so a batch being collected or
+            # flushed is always written before the task exits
+            await self._queue.put(_STOP)
+            await self._task
+            self._task = None
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            await self._flush(batch)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            try:
+                if self._queue.qsize() < self.max_batch - 1:
+                    await asyncio.sleep(self.interval)
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    item = self._queue.get_nowait()
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            finally:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[dict]):
+        # Callers already got their ids back, so transient failures (failover,
+        # network blips, server selection) are retried with backoff before giving up
+        for attempt in range(self.retries + 1):
+            try:
+                await db[self.collection_name].insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                # A retry may find documents the earlier attempt already wrote
+                failed = [
+                    err["op"]["_id"] for err in e.details.get("writeErrors", [])
+                    if not (attempt and err.get("code") == DUPLICATE_KEY)
+                ]
+                if failed:
+                    logger.error("Failed to insert %d documents into %s: %s",
+                                 len(failed), self.collection_name, [str(_id) for _id in failed])
+                return
+            except TRANSIENT_ERRORS as e:
+                error = e
+                if attempt < self.retries:
+                    await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+            except Exception as e:
+                error = e
+                break
+        logger.error("Failed to flush %d documents into %s: %s",
+                     len(batch), self.collection_name, [str(doc["_id"]) for doc in batch], exc_info=error)
+
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -51,5 +173,96 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     cursor = db[collection_name].find(filter_dict or {})
     if limit:
         cursor = cursor.limit(limit)
-    
-    return list(cursor)
+
+    return await cursor.to_list(length=limit)
+
+# Aggregation stages that render _id as a string "id" on the server
+ID_AS_STRING = [
+    {"$addFields": {"id": {"$toString": "$_id"}}},
+    {"$project": {"_id": 0}},
+]
+
+def iter_documents_with_id(collection_name: str, filter_dict: dict = None, limit: int = None, sort: dict = None,
+                           batch_size: int = None):
+    """Cursor over documents from collection with _id already converted to a string "id" field"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+    pipeline = [{"$match": filter_dict or {}}]
+    if sort:
+        pipeline.append({"$sort": sort})
+    if limit:
+        pipeline.append({"$limit": limit})
+    pipeline.extend(ID_AS_STRING)
+
+    # Without an explicit batch size, a batch the size of the limit fetches the
+    # whole page in one round-trip
+    batch_size = batch_size or limit
+    if batch_size:
+        return db[collection_name].aggregate(pipeline, batchSize=batch_size)
+    return db[collection_name].aggregate(pipeline)
+
+async def backfill_title_lc():
+    """Set title_lc on recipes inserted before it was stored alongside the title"""
+    if db is None:
+        return
+
+    # Lowercased in Python, not with $toLower (ASCII-only), so backfilled values
+    # match what create_recipe stores and what title_prefix searches for
+    cursor = db["recipe"].find({"title_lc": {"$exists": False}, "title": {"$type": "string"}}, {"title": 1})
+    updates = []
+    async for doc in cursor:
+        updates.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"title_lc": doc["title"].lower()}}))
+        if len(updates) >= 500:
+            await db["recipe"].bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db["recipe"].bulk_write(updates, ordered=False)
+
+async def convert_comment_recipe_ids():
+    """Convert recipe_id on comments written before it was stored as an ObjectId"""
+    if db is None:
+        return
+
+    await db["comment"].update_many(
+        {"recipe_id": {"$type": "string"}},
+        [{"$set": {"recipe_id": {"$convert": {"input": "$recipe_id", "to": "objectId", "onError": "$recipe_id"}}}}],
+    )
+
+# $gt "" only matches strings, and excludes the empty one
+SLUG_INDEX_FILTER = {"slug": {"$gt": ""}}
+
+async def ensure_indexes():
+    """Create the indexes backing the API query shapes"""
+    if db is None:
+        return
+
+    # Lowercased title for anchored prefix search, text index for multi-word search
+    await db["recipe"].create_index("title_lc")
+    await db["recipe"].create_index([("title", "text")])
+    # Multikey compound index: tag equality (via its prefix) and tag + title prefix
+    await db["recipe"].create_index([("tags", 1), ("title_lc", 1)])
+    # Unique slug lookup for get_recipe, also covers the slug-only sitemap projection.
+    # Partial on non-empty string slugs, so recipes with a null or empty slug
+    # stay out of the index (and out of the uniqueness check)
+    try:
+        await db["recipe"].create_index(
+            "slug",
+            name="slug_unique_nonempty",
+            unique=True,
+            partialFilterExpression=SLUG_INDEX_FILTER,
+        )
+    except OperationFailure as e:
+        if e.code != DUPLICATE_KEY:
+            raise
+        # Recipes with the same title used to share a slug; keep lookups on a
+        # non-unique index until those are renamed
+        logger.error("Duplicate recipe slugs prevent the unique slug index: %s", e)
+        await db["recipe"].create_index(
+            "slug",
+            name="slug_nonempty",
+            partialFilterExpression=SLUG_INDEX_FILTER,
+        )
+
+    # Comments for a recipe, newest first, served from one index
+    await db["comment"].create_index([("recipe_id", 1), ("_id", -1)])
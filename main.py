@@ -1,85 +1,293 @@
 import os
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.middleware.cors import CORSMiddleware
+import re
+import gzip
+import time
+import asyncio
+import logging
+import hashlib
+import functools
+from typing import Any, AsyncIterator, List, Optional
+import brotli
+import orjson
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from bson import ObjectId
+from bson.regex import Regex
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import Headers, MutableHeaders
 
-from database import db, create_document, get_documents
+from database import db, create_document, iter_documents_with_id, ensure_indexes, backfill_title_lc, convert_comment_recipe_ids, BatchWriter
 from schemas import Recipe, Comment, Category
 
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Recipe Blog API", version="1.0.0")
+def orjson_default(obj: Any) -> str:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError
+
+
+class MongoJSONResponse(ORJSONResponse):
+    """ORJSONResponse that renders ObjectIds as strings during serialization"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Read endpoints build their responses directly (MongoJSONResponse or a streamed
+# array), skipping FastAPI's response validation and jsonable_encoder pass
+app = FastAPI(title="Recipe Blog API", version="1.0.0", default_response_class=MongoJSONResponse)
+
+# HTTP caching: weak ETags + Cache-Control on read endpoints
+
+API_MAX_AGE = 60
+SITEMAP_MAX_AGE = 3600
+SITEMAP_REFRESH_SECONDS = 300
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (t.removeprefix("W/") for t in tags)
+
+
+def is_cacheable_path(path: str) -> bool:
+    if path in ("/api/recipes", "/api/categories"):
+        return True
+    # /api/recipes/{slug}, but not the comments sub-resource
+    return path.startswith("/api/recipes/") and path.count("/") == 3
+
+
+class ETagMiddleware:
+    """Hash cacheable GET responses into a weak ETag and answer 304 on a match"""
+
+    def __init__(self, app, max_age: int = API_MAX_AGE):
+        self.app = app
+        self.max_age = max_age
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not is_cacheable_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start: dict = {}
+        chunks: List[bytes] = []
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(chunks)
+            headers = MutableHeaders(scope=start)
+            if start["status"] == 200 and "etag" not in headers:
+                etag = f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+                headers["ETag"] = etag
+                headers["Cache-Control"] = f"public, max-age={self.max_age}"
+                if etag_matches(if_none_match, etag):
+                    del headers["content-length"]
+                    del headers["content-type"]
+                    start["status"] = 304
+                    body = b""
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_with_etag)
+
+
+app.add_middleware(ETagMiddleware)
+
+# CORS: the API allows every origin, so the headers are static and need no
+# per-request origin matching
+
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+PREFLIGHT_HEADERS = [
+    (b"access-control-allow-origin", b"*"),
+    (b"access-control-allow-methods", b"DELETE, GET, HEAD, OPTIONS, PATCH, POST, PUT"),
+    (b"access-control-max-age", b"600"),
+]
+
+
+class StaticCORSMiddleware:
+    """Append allow-all CORS headers under a path prefix and answer preflights with 204"""
+
+    def __init__(self, app, path_prefix: str = "/api/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS":
+            headers = list(PREFLIGHT_HEADERS)
+            for name, value in scope["headers"]:
+                if name == b"access-control-request-headers":
+                    headers.append((b"access-control-allow-headers", value))
+            await send({"type": "http.response.start", "status": 204, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *CORS_HEADERS]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app.add_middleware(StaticCORSMiddleware)
+
+# Outermost, so ETags are computed on the uncompressed body; already-encoded
+# responses (the precompressed sitemap) pass through untouched
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+# Comments arrive in bursts; coalesce them into insert_many batches
+comment_writer = BatchWriter("comment")
+
+
+@app.on_event("startup")
+async def startup():
+    # An unreachable database must not keep the API from booting; /test reports it
+    try:
+        await ensure_indexes()
+        await backfill_title_lc()
+        await convert_comment_recipe_ids()
+    except Exception:
+        logger.exception("Failed to prepare database indexes and migrations")
+    if db is not None:
+        comment_writer.start()
+        app.state.sitemap_task = asyncio.create_task(refresh_sitemap_forever())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await comment_writer.stop()
+    sitemap_task = getattr(app.state, "sitemap_task", None)
+    if sitemap_task is not None:
+        # Wait for the cancelled refresher so no build outlives the Motor client
+        sitemap_task.cancel()
+        try:
+            await sitemap_task
+        except asyncio.CancelledError:
+            pass
+        app.state.sitemap_task = None
 
 
 # Utility: convert ObjectId to str for JSON
 
 def serialize_doc(doc: dict) -> dict:
+    # The driver hands back a fresh dict per document, so mutate it in place.
+    # Any other ObjectId fields are rendered by MongoJSONResponse.
     if not doc:
         return doc
-    d = dict(doc)
-    if "_id" in d:
-        d["id"] = str(d.pop("_id"))
-    # Convert nested ObjectIds if any
-    for k, v in list(d.items()):
-        if isinstance(v, ObjectId):
-            d[k] = str(v)
-    return d
+    if "_id" in doc:
+        doc["id"] = str(doc.pop("_id"))
+    return doc
+
+
+async def _json_array_chunks(first: List[dict], cursor, batch_size: int) -> AsyncIterator[bytes]:
+    # One orjson call and one write per cursor batch; [1:-1] drops the brackets
+    yield b"[" + orjson.dumps(first, default=orjson_default)[1:-1]
+    while batch := await cursor.to_list(length=batch_size):
+        yield b"," + orjson.dumps(batch, default=orjson_default)[1:-1]
+    yield b"]"
+
+
+async def stream_json_array(cursor, batch_size: int) -> Response:
+    """Stream a cursor as a JSON array, one chunk per batch of documents.
+
+    The first batch is fetched before any headers go out, so a failing query
+    still surfaces as a 500 instead of a truncated 200.
+    """
+    first = await cursor.to_list(length=batch_size)
+    if not first:
+        return MongoJSONResponse([])
+    return StreamingResponse(_json_array_chunks(first, cursor, batch_size), media_type="application/json")
 
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "Recipe Blog API running"}
 
 
 # Recipes
-@app.post("/api/recipes", response_model=dict)
-def create_recipe(recipe: Recipe):
+@functools.lru_cache(maxsize=1024)
+def title_prefix(q: str) -> Regex:
+    """Anchored, case-sensitive prefix regex on title_lc, cached per search term"""
+    return Regex(f"^{re.escape(q.lower())}")
+
+
+@app.post("/api/recipes")
+async def create_recipe(recipe: Recipe):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
 
-    # Generate slug if not provided
-    slug = recipe.slug or "-".join(recipe.title.lower().split())
     data = recipe.model_dump()
-    data["slug"] = slug
-    inserted_id = create_document("recipe", data)
+    # Normalized title backing the anchored prefix search in list_recipes
+    data["title_lc"] = recipe.title.lower()
+    try:
+        inserted_id = await create_document("recipe", data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="Recipe slug already exists")
     return {"id": inserted_id}
 
 
-@app.get("/api/recipes", response_model=List[dict])
-def list_recipes(q: Optional[str] = None, tag: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
+@app.get("/api/recipes")
+async def list_recipes(q: Optional[str] = None, tag: Optional[str] = None, limit: int = Query(20, ge=1, le=100)):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
     filter_dict: dict = {}
+    sort = None
+    q = q.strip() if q else q
     if q:
-        filter_dict["title"] = {"$regex": q, "$options": "i"}
+        if len(q.split()) > 1:
+            # Multi-word search goes through the text index; rank by relevance
+            # so the limit keeps the best matches rather than arbitrary ones
+            filter_dict["$text"] = {"$search": q}
+            sort = {"score": {"$meta": "textScore"}}
+        else:
+            # Anchored, case-sensitive regex on title_lc becomes an index range scan
+            filter_dict["title_lc"] = title_prefix(q)
     if tag:
-        filter_dict["tags"] = {"$in": [tag]}
-    docs = get_documents("recipe", filter_dict, limit)
-    return [serialize_doc(d) for d in docs]
+        # Scalar equality matches array members and uses the multikey index
+        filter_dict["tags"] = tag
+    # Buffered by ETagMiddleware anyway, so fetch the page and encode it once
+    docs = await iter_documents_with_id("recipe", filter_dict, limit, sort=sort).to_list(length=limit)
+    return MongoJSONResponse(docs)
 
 
-@app.get("/api/recipes/{slug}", response_model=dict)
-def get_recipe(slug: str):
+@app.get("/api/recipes/{slug}")
+async def get_recipe(slug: str):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    doc = db["recipe"].find_one({"slug": slug})
+    # Repeating the partial index filter lets the planner pick the slug index
+    doc = await db["recipe"].find_one({"slug": {"$eq": slug, "$gt": ""}})
     if not doc:
         raise HTTPException(status_code=404, detail="Recipe not found")
-    return serialize_doc(doc)
+    return MongoJSONResponse(serialize_doc(doc))
 
 
 # Comments
-@app.post("/api/recipes/{recipe_id}/comments", response_model=dict)
-def add_comment(recipe_id: str, comment: Comment):
+# Comment pages (up to 200) are streamed in batches of this many documents
+COMMENT_BATCH_SIZE = 50
+
+
+@app.post("/api/recipes/{recipe_id}/comments")
+async def add_comment(recipe_id: str, comment: Comment):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
     # ensure recipe exists
@@ -87,56 +295,131 @@ def add_comment(recipe_id: str, comment: Comment):
         _id = ObjectId(recipe_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid recipe id")
-    exists = db["recipe"].find_one({"_id": _id})
+    # Index-only existence check; the recipe document itself is never fetched
+    exists = await db["recipe"].count_documents({"_id": _id}, limit=1)
     if not exists:
         raise HTTPException(status_code=404, detail="Recipe not found")
 
     data = comment.model_dump()
-    data["recipe_id"] = recipe_id
-    inserted_id = create_document("comment", data)
+    # Stored as ObjectId: a 12-byte key keeps the recipe_id index compact
+    data["recipe_id"] = _id
+    inserted_id = await comment_writer.insert(data)
     return {"id": inserted_id}
 
 
-@app.get("/api/recipes/{recipe_id}/comments", response_model=List[dict])
-def list_comments(recipe_id: str, limit: int = Query(50, ge=1, le=200)):
+@app.get("/api/recipes/{recipe_id}/comments")
+async def list_comments(recipe_id: str, limit: int = Query(50, ge=1, le=200)):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    docs = get_documents("comment", {"recipe_id": recipe_id}, limit)
-    return [serialize_doc(d) for d in docs]
+    try:
+        _id = ObjectId(recipe_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid recipe id")
+    # Also match the string form, in case older comments are not yet converted
+    filter_dict = {"recipe_id": {"$in": [_id, recipe_id]}}
+    cursor = iter_documents_with_id("comment", filter_dict, limit, sort={"_id": -1}, batch_size=COMMENT_BATCH_SIZE)
+    return await stream_json_array(cursor, COMMENT_BATCH_SIZE)
 
 
 # Categories
-@app.post("/api/categories", response_model=dict)
-def create_category(category: Category):
+@app.post("/api/categories")
+async def create_category(category: Category):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    inserted_id = create_document("category", category)
+    inserted_id = await create_document("category", category)
     return {"id": inserted_id}
 
 
-@app.get("/api/categories", response_model=List[dict])
-def list_categories(limit: int = Query(50, ge=1, le=200)):
+@app.get("/api/categories")
+async def list_categories(limit: int = Query(50, ge=1, le=200)):
     if db is None:
         raise HTTPException(status_code=500, detail="Database not configured")
-    docs = get_documents("category", {}, limit)
-    return [serialize_doc(d) for d in docs]
+    docs = await iter_documents_with_id("category", {}, limit).to_list(length=limit)
+    return MongoJSONResponse(docs)
 
 
 # SEO helper endpoint for sitemap
-@app.get("/sitemap.xml", response_class=None)
-def sitemap():
+# Built in the background and served precompressed; the handler never touches the DB
+_sitemap: dict = {"etag": None, "xml": b"", "gz": b"", "br": b""}
+# Serializes builds so concurrent first requests and the refresher build only once
+_sitemap_lock = asyncio.Lock()
+
+SITEMAP_HEAD = (
+    b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n"
+    b"<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">\n"
+)
+SITEMAP_TAIL = b"</urlset>"
+
+
+async def build_sitemap() -> bytes:
     base = os.getenv("FRONTEND_URL", "")
-    urls = []
-    for r in db["recipe"].find({}, {"slug": 1}).limit(500):
-        urls.append(f"  <url><loc>{base}/recipe/{r['slug']}</loc></url>")
-    xml = "\n".join([
-        "<?xml version=\"1.0\" encoding=\"UTF-8\"?>",
-        "<urlset xmlns=\"http://www.sitemaps.org/schemas/sitemap/0.9\">",
-        *urls,
-        "</urlset>",
-    ])
-    from fastapi.responses import Response
-    return Response(content=xml, media_type="application/xml")
+    # Repeating the partial index filter keeps the query on the slug index and the projection covers it
+    cursor = db["recipe"].find({"slug": {"$gt": ""}}, {"slug": 1, "_id": 0}).limit(500).batch_size(500)
+    urls = [f"  <url><loc>{base}/recipe/{r['slug']}</loc></url>\n".encode() async for r in cursor]
+    return SITEMAP_HEAD + b"".join(urls) + SITEMAP_TAIL
+
+
+async def refresh_sitemap():
+    xml = await build_sitemap()
+    etag = f'W/"{hashlib.blake2b(xml, digest_size=12).hexdigest()}"'
+    if etag == _sitemap["etag"]:
+        return
+    _sitemap.update(
+        xml=xml,
+        gz=gzip.compress(xml, compresslevel=6),
+        br=brotli.compress(xml),
+        etag=etag,
+    )
+
+
+async def refresh_sitemap_forever():
+    while True:
+        try:
+            async with _sitemap_lock:
+                await refresh_sitemap()
+        except Exception:
+            logger.exception("Failed to refresh sitemap")
+        await asyncio.sleep(SITEMAP_REFRESH_SECONDS)
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Content codings from an Accept-Encoding header, minus those refused with q=0"""
+    codings = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        codings.add(coding.strip().lower())
+    return codings
+
+
+@app.get("/sitemap.xml", response_class=None)
+async def sitemap(request: Request):
+    if _sitemap["etag"] is None:
+        # Not built yet (first request raced the startup refresh)
+        async with _sitemap_lock:
+            if _sitemap["etag"] is None:
+                await refresh_sitemap()
+
+    etag = _sitemap["etag"]
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={SITEMAP_MAX_AGE}",
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    encodings = accepted_encodings(request.headers.get("accept-encoding", ""))
+    if "br" in encodings:
+        headers["Content-Encoding"] = "br"
+        content = _sitemap["br"]
+    elif "gzip" in encodings:
+        headers["Content-Encoding"] = "gzip"
+        content = _sitemap["gz"]
+    else:
+        content = _sitemap["xml"]
+    return Response(content=content, media_type="application/xml", headers=headers)
 
 
 # AI: simple live update suggestion endpoint (mocked deterministic)
@@ -145,24 +428,33 @@ class AISuggestRequest(BaseModel):
     ingredients: List[str]
 
 
-@app.post("/api/ai/suggest", response_model=dict)
-def ai_suggest(data: AISuggestRequest):
+# (needles, fires when a needle is present, tip)
+SUGGEST_RULES = (
+    (("salt",), False, "Add a pinch of salt to enhance flavors."),
+    (("lemon", "lime"), True, "A squeeze of citrus at the end brightens the dish."),
+    (("garlic",), True, "Saute garlic gently; burnt garlic turns bitter."),
+)
+
+
+@app.post("/api/ai/suggest")
+async def ai_suggest(data: AISuggestRequest):
     # Very simple heuristic suggestion instead of external API
     tips = []
-    ings = ", ".join(data.ingredients)
-    if "salt" not in ings.lower():
-        tips.append("Add a pinch of salt to enhance flavors.")
-    if "lemon" in ings.lower() or "lime" in ings.lower():
-        tips.append("A squeeze of citrus at the end brightens the dish.")
-    if "garlic" in ings.lower():
-        tips.append("Saute garlic gently; burnt garlic turns bitter.")
+    ings = ", ".join(data.ingredients).lower()
+    for needles, when_present, tip in SUGGEST_RULES:
+        if any(needle in ings for needle in needles) == when_present:
+            tips.append(tip)
     if not tips:
         tips.append("Taste as you cook and adjust seasoning gradually.")
     return {"tips": tips[:3]}
 
 
+COLLECTIONS_CACHE_SECONDS = 5
+_collections_cache: dict = {"at": float("-inf"), "names": []}
+
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -181,8 +473,11 @@ def test_database():
             response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                # Listing collections reads the catalog; reuse it for a few seconds
+                if time.monotonic() - _collections_cache["at"] >= COLLECTIONS_CACHE_SECONDS:
+                    _collections_cache["names"] = await db.list_collection_names()
+                    _collections_cache["at"] = time.monotonic()
+                response["collections"] = _collections_cache["names"][:10]
                 response["database"] = "✅ Connected & Working"
             except Exception as e:
                 response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
@@ -8,7 +8,7 @@ Use these schemas for validation when creating documents.
 """
 
 from typing import List, Optional
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl, field_serializer, model_validator
 
 
 class Recipe(BaseModel):
@@ -27,13 +27,25 @@ class Recipe(BaseModel):
     author: Optional[str] = Field(None, description="Author name")
     tags: List[str] = Field(default_factory=list, description="SEO tags")
 
+    @model_validator(mode="after")
+    def _slugify(self) -> "Recipe":
+        # Generate slug from the title if not provided
+        if not self.slug:
+            self.slug = "-".join(self.title.lower().split())
+        return self
+
+    @field_serializer("image_url")
+    def _image_url_str(self, image_url: Optional[HttpUrl]) -> Optional[str]:
+        # Validated as a URL on input, stored and returned as a plain string
+        return str(image_url) if image_url is not None else None
+
 
 class Comment(BaseModel):
     """
     Comments collection schema
     Collection name: "comment"
     """
-    recipe_id: str = Field(..., description="Associated recipe id (string)")
+    recipe_id: str = Field(..., description="Associated recipe id (string, stored as ObjectId)")
     name: str = Field(..., min_length=2, max_length=60, description="Commenter name")
     message: str = Field(..., min_length=1, max_length=1000, description="Comment text")
 
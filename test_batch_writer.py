@@ -0,0 +1,114 @@
+import asyncio
+
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import database
+from database import BatchWriter
+
+
+class FakeCollection:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.batches = []
+
+    async def insert_many(self, batch, ordered=True):
+        await asyncio.sleep(self.delay)
+        self.batches.append(list(batch))
+
+    @property
+    def written(self):
+        return sum(len(b) for b in self.batches)
+
+
+def run_writer(monkeypatch, scenario, delay: float = 0, collection=None, **kwargs):
+    collection = collection or FakeCollection(delay)
+    monkeypatch.setattr(database, "db", {"comment": collection})
+
+    async def main():
+        writer = BatchWriter("comment", **kwargs)
+        writer.start()
+        await scenario(writer)
+        await asyncio.wait_for(writer.stop(), timeout=2)
+
+    asyncio.run(main())
+    return collection
+
+
+def test_stop_right_after_queueing(monkeypatch):
+    async def scenario(writer):
+        for i in range(5):
+            await writer.insert({"i": i})
+
+    assert run_writer(monkeypatch, scenario).written == 5
+
+
+def test_stop_during_collect_window(monkeypatch):
+    async def scenario(writer):
+        for i in range(5):
+            await writer.insert({"i": i})
+        await asyncio.sleep(0.01)
+
+    assert run_writer(monkeypatch, scenario, interval=0.05).written == 5
+
+
+def test_stop_during_flush(monkeypatch):
+    async def scenario(writer):
+        for i in range(5):
+            await writer.insert({"i": i})
+        await asyncio.sleep(0.03)
+
+    assert run_writer(monkeypatch, scenario, delay=0.1).written == 5
+
+
+def test_batches_are_capped(monkeypatch):
+    async def scenario(writer):
+        for i in range(120):
+            await writer.insert({"i": i})
+        await asyncio.sleep(0.1)
+
+    collection = run_writer(monkeypatch, scenario)
+    assert collection.written == 120
+    assert max(len(b) for b in collection.batches) <= 50
+
+
+def test_full_queue_applies_backpressure(monkeypatch):
+    async def scenario(writer):
+        for i in range(10):
+            await writer.insert({"i": i})
+
+    collection = run_writer(monkeypatch, scenario, delay=0.01, max_batch=2, max_queued=2)
+    assert collection.written == 10
+
+
+class FlakyCollection(FakeCollection):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = list(failures)
+
+    async def insert_many(self, batch, ordered=True):
+        if self.failures:
+            raise self.failures.pop(0)
+        await super().insert_many(batch, ordered)
+
+
+def test_transient_failure_is_retried(monkeypatch):
+    async def scenario(writer):
+        for i in range(5):
+            await writer.insert({"i": i})
+
+    collection = FlakyCollection([AutoReconnect("connection reset")])
+    run_writer(monkeypatch, scenario, collection=collection, retry_backoff=0)
+    assert collection.written == 5
+
+
+def test_bulk_write_error_logs_only_failed_ids(monkeypatch, caplog):
+    ids = []
+
+    async def scenario(writer):
+        for i in range(3):
+            ids.append(await writer.insert({"i": i}))
+
+    failure = BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "op": {"_id": "bad-id"}}]})
+    run_writer(monkeypatch, scenario, collection=FlakyCollection([failure]))
+    assert "bad-id" in caplog.text
+    assert not any(_id in caplog.text for _id in ids)
@@ -0,0 +1,149 @@
+import gzip
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+from main import accepted_encodings, etag_matches
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    async def to_list(self, length=None):
+        out, self.docs = self.docs[:length], self.docs[length:]
+        return out
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def aggregate(self, pipeline, **kwargs):
+        return FakeCursor(self.docs)
+
+    def find(self, *args, **kwargs):
+        return FakeCursor(self.docs)
+
+
+RECIPES = [{"id": str(i), "title": f"Recipe {i}", "slug": f"recipe-{i}", "tags": ["dinner"] * 10} for i in range(20)]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake_db = {
+        "recipe": FakeCollection(RECIPES),
+        "comment": FakeCollection([{"id": "c1", "message": "Nice"}]),
+        "category": FakeCollection([]),
+    }
+    monkeypatch.setattr(database, "db", fake_db)
+    monkeypatch.setattr(main, "db", fake_db)
+    monkeypatch.setitem(main._sitemap, "etag", None)
+    return TestClient(main.app)
+
+
+def test_etag_matches():
+    assert etag_matches('W/"abc"', 'W/"abc"')
+    assert etag_matches('"abc"', 'W/"abc"')
+    assert etag_matches('"x", W/"abc"', 'W/"abc"')
+    assert etag_matches("*", 'W/"abc"')
+    assert not etag_matches('W/"other"', 'W/"abc"')
+    assert not etag_matches(None, 'W/"abc"')
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, br") == {"gzip", "br"}
+    assert accepted_encodings("GZIP;q=0.5, br;q=0") == {"gzip"}
+
+
+def test_list_revalidates_with_304(client):
+    first = client.get("/api/recipes", headers={"Accept-Encoding": "identity"})
+    assert first.status_code == 200
+    assert first.headers["etag"].startswith('W/"')
+    assert first.headers["cache-control"] == f"public, max-age={main.API_MAX_AGE}"
+
+    second = client.get("/api/recipes", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == first.headers["etag"]
+    assert "content-type" not in second.headers
+    assert "content-length" not in second.headers
+
+
+def test_etag_is_computed_inside_gzip(client):
+    identity = client.get("/api/recipes", headers={"Accept-Encoding": "identity"})
+    compressed = client.get("/api/recipes", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.headers["etag"] == identity.headers["etag"]
+    assert compressed.json() == identity.json()
+
+
+def test_comments_are_not_etagged(client):
+    response = client.get(f"/api/recipes/{'0' * 24}/comments")
+    assert response.status_code == 200
+    assert response.json() == [{"id": "c1", "message": "Nice"}]
+    assert "etag" not in response.headers
+
+
+@pytest.mark.parametrize("accept, encoding", [("br, gzip", "br"), ("gzip", "gzip"), ("identity", None)])
+def test_sitemap_picks_precompressed_body(client, accept, encoding):
+    response = client.get("/sitemap.xml", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("content-encoding") == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == main._sitemap["xml"]
+    assert b"<loc>/recipe/recipe-0</loc>" in response.content
+
+
+def test_sitemap_gzip_body_is_the_stored_one(client):
+    client.get("/sitemap.xml")
+    assert gzip.decompress(main._sitemap["gz"]) == main._sitemap["xml"]
+
+
+def test_sitemap_revalidates_with_304(client):
+    first = client.get("/sitemap.xml")
+    second = client.get("/sitemap.xml", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert second.content == b""
+
+
+def test_cors_preflight_short_circuits(client):
+    response = client.options("/api/recipes", headers={
+        "Origin": "https://example.com",
+        "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type, x-custom",
+    })
+    assert response.status_code == 204
+    assert response.headers["access-control-allow-origin"] == "*"
+    assert "POST" in response.headers["access-control-allow-methods"]
+    assert response.headers["access-control-allow-headers"] == "content-type, x-custom"
+
+
+def test_cors_headers_only_under_api(client):
+    api = client.get("/api/categories")
+    assert api.headers["access-control-allow-origin"] == "*"
+    assert "access-control-allow-origin" not in client.get("/").headers
+
+
+def test_cors_header_survives_304(client):
+    first = client.get("/api/recipes")
+    second = client.get("/api/recipes", headers={"If-None-Match": first.headers["etag"]})
+    assert second.status_code == 304
+    assert second.headers["access-control-allow-origin"] == "*"